@@ -1,13 +1,24 @@
 import csv
+import errno
+import gzip
+import hashlib
+import heapq
+import itertools
 import json
+import math
 import os
+import re
 import shlex
-import shutil
 import subprocess
 import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
 
 import requests
-from flask import Flask, jsonify, request
+from flask import Flask, has_request_context, jsonify, request
 
 app = Flask(__name__)
 
@@ -28,47 +39,273 @@ def format_time():
     return __import__("datetime").datetime.now().strftime(TIMESTAMP_FMT)
 
 
+BACKUP_MODES = ("copy", "compact", "gzip")
+BACKUP_MODE = os.getenv("ACP_BACKUP_MODE", "copy")
+if BACKUP_MODE not in BACKUP_MODES:
+    raise ValueError(f"ACP_BACKUP_MODE must be one of {', '.join(BACKUP_MODES)} (got {BACKUP_MODE!r})")
+BACKUP_KEEP = int(os.getenv("ACP_BACKUP_KEEP", "0"))  # 0 = keep all
+
+_ARTIFACT_LOCKS = {}
+_VERSION_INDEX = {}  # (root, ext) -> next free version number
+_NO_HARDLINK_DIRS = set()
+_NO_HARDLINK_ERRNOS = {errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV}
+_WRITE_LOCK = threading.Lock()
+
+
+@contextmanager
+def artifact_lock(ref: str):
+    """Serialize read-modify-write cycles on the same artifact across request threads."""
+    # key on the file actually read/written, so aliases (symlinks, repo-prefixed refs) share a lock
+    key = ref if ref.startswith(("http://", "https://")) else os.path.realpath(resolve_local_path(ref))
+    with _WRITE_LOCK:
+        lock = _ARTIFACT_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        yield
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_temp(directory: str, data: bytes, mode: int = None):
+    while True:
+        tmp = os.path.join(directory, f".acp-{uuid.uuid4().hex}.tmp")
+        try:
+            # 0o666 so the process umask applies, as with a plain open()
+            fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if mode is not None:
+                os.fchmod(f.fileno(), mode)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Write via temp file + fsync + rename so readers never see a truncated file."""
+    # replace the link target, not the link, so shared artifacts behind symlinks keep updating
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = None
+    tmp = _write_temp(directory, data, mode)
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _fsync_dir(directory)
+
+
+def _next_version(root: str, ext: str):
+    """Next free `-assistant-vN` number; the directory is scanned once per artifact, then O(1)."""
+    key = (root, ext)
+    if key not in _VERSION_INDEX:
+        directory, base = os.path.split(root)
+        pattern = re.compile(re.escape(base) + r"-assistant-v(\d+)" + re.escape(ext) + "$")
+        highest = 0
+        for name in os.listdir(directory or "."):
+            m = pattern.match(name)
+            if m:
+                highest = max(highest, int(m.group(1)))
+        _VERSION_INDEX[key] = highest + 1
+    n = _VERSION_INDEX[key]
+    _VERSION_INDEX[key] = n + 1
+    return n
+
+
+def _write_new_version(target: str, data: bytes):
+    root, ext = os.path.splitext(target)
+    directory = os.path.dirname(os.path.abspath(target))
+    tmp = _write_temp(directory, data)
+    candidate = None
+    try:
+        while True:
+            if candidate is None:
+                with _WRITE_LOCK:
+                    candidate = f"{root}-assistant-v{_next_version(root, ext)}{ext}"
+            try:
+                if directory not in _NO_HARDLINK_DIRS:
+                    # link fails if the name is taken, so concurrent writers never clobber a version
+                    os.link(tmp, candidate)
+                else:
+                    # no hard links (some SMB/FUSE mounts): reserve the name, then rename over it
+                    os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    try:
+                        os.replace(tmp, candidate)
+                    except BaseException:
+                        os.unlink(candidate)
+                        raise
+                break
+            except FileExistsError:
+                candidate = None
+            except OSError as e:
+                if directory in _NO_HARDLINK_DIRS or e.errno not in _NO_HARDLINK_ERRNOS:
+                    raise
+                _NO_HARDLINK_DIRS.add(directory)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    _fsync_dir(directory)
+    return candidate
+
+
+def _prune_backups(target: str, keep: int):
+    directory, base = os.path.split(os.path.abspath(target))
+    prefix = base + ".bak_"
+    backups = sorted((n for n in os.listdir(directory) if n.startswith(prefix)), key=lambda n: n[:-3] if n.endswith(".gz") else n)
+    for name in backups[: max(0, len(backups) - keep)]:
+        try:
+            os.unlink(os.path.join(directory, name))
+        except OSError as e:
+            print(f"[backup-warning] failed to prune {name}: {e}", file=sys.stderr)
+
+
+def write_backup(target: str, mode: str = BACKUP_MODE, keep: int = BACKUP_KEEP):
+    """Back up `target` as a full copy, compact JSON, or gzipped compact JSON; prune to `keep`."""
+    stamp = f"{target}.bak_{format_time()}"
+    suffix = ".gz" if mode == "gzip" else ""
+    with open(target, "rb") as f:
+        data = f.read()
+    if mode != "copy":
+        try:
+            data = json.dumps(json.loads(data), separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            pass  # not JSON (e.g. an arbitrary outputPath); keep the original bytes
+        if mode == "gzip":
+            data = gzip.compress(data)
+    # claim the name exclusively so a second backup in the same second cannot overwrite this one;
+    # zero-padded counters keep names in chronological order for _prune_backups
+    for n in itertools.count():
+        stem = f"{stamp}{f'_{n:06d}' if n else ''}"
+        backup_file = stem + suffix
+        if os.path.exists(stem + (".gz" if not suffix else "")):
+            continue  # same stem taken by a backup in the other mode
+        try:
+            os.close(os.open(backup_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+            break
+        except FileExistsError:
+            continue
+    try:
+        atomic_write_bytes(backup_file, data)
+    except BaseException:
+        os.unlink(backup_file)
+        raise
+    if keep > 0:
+        _prune_backups(target, keep)
+    return backup_file
+
+
 def write_json(target: str, obj, backup: bool = True, overwrite: bool = True):
     if target.startswith("http://") or target.startswith("https://"):
         raise ValueError("write only supported to local files")
 
-    final_target = target
+    data = json.dumps(obj, indent=2).encode("utf-8")
     backup_file = None
 
     if not overwrite and os.path.exists(target):
-        root, ext = os.path.splitext(target)
-        i = 1
-        while True:
-            candidate = f"{root}-assistant-v{i}{ext}"
-            if not os.path.exists(candidate):
-                final_target = candidate
-                break
-            i += 1
+        return _write_new_version(target, data), None
 
-    if overwrite and backup and os.path.exists(final_target):
-        backup_file = f"{final_target}.bak_{format_time()}"
-        shutil.copyfile(final_target, backup_file)
+    if overwrite and backup and os.path.exists(target):
+        backup_file = write_backup(target)
 
-    with open(final_target, "w", encoding="utf-8") as f:
-        json.dump(obj, f, indent=2)
+    atomic_write_bytes(target, data)
+    return target, backup_file
 
-    return final_target, backup_file
 
+PROMPT_RELOAD_SECS = float(os.getenv("ACP_PROMPT_RELOAD_SECS", "2"))
 
-_PROMPT_CACHE = {}
+OUTPUT_RULES = [
+    "- Return exactly ONE JSON object.",
+    "- Do NOT wrap output in markdown, code fences, or prose.",
+    "- If uncertain, return required keys with empty arrays/strings.",
+    "- Respect schema constraints and allowed IDs.",
+]
 
+PromptTemplate = namedtuple("PromptTemplate", ["tool", "version", "prefix"])
 
-def load_prompt_file(name: str):
-    if name in _PROMPT_CACHE:
-        return _PROMPT_CACHE[name]
-    path = os.path.join(PROMPT_DIR, name)
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            txt = f.read().strip()
-            _PROMPT_CACHE[name] = txt
-            return txt
-    except Exception:
-        return ""
+
+class PromptRegistry:
+    """
+    Precompiled static prompt sections per tool, hot-reloaded on mtime changes.
+    Files are re-stat'ed at most once per `reload_secs` (missing files included);
+    each compiled prefix carries a content hash usable as a cache key.
+    """
+
+    def __init__(self, prompt_dir: str, tool_prompts: dict, reload_secs: float = PROMPT_RELOAD_SECS):
+        self.prompt_dir = prompt_dir
+        self.tool_prompts = tool_prompts
+        self.reload_secs = reload_secs
+        self._files = {}  # name -> (checked_at, mtime, text)
+        self._templates = {}  # tool -> (mtimes, PromptTemplate)
+        self._lock = threading.Lock()
+
+    def _file(self, name: str):
+        now = time.monotonic()
+        cached = self._files.get(name)
+        if cached and now - cached[0] < self.reload_secs:
+            return cached[1], cached[2]
+        path = os.path.join(self.prompt_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if cached and cached[1] == mtime:
+            text = cached[2]
+        elif mtime is None:
+            text = ""
+        else:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read().strip()
+            except Exception:
+                mtime, text = None, ""
+        self._files[name] = (now, mtime, text)
+        return mtime, text
+
+    def template(self, tool: str):
+        prompt_cfg = self.tool_prompts.get(tool, {})
+        names = prompt_cfg.get("overview", []) + prompt_cfg.get("spec", [])
+        with self._lock:
+            files = {n: self._file(n) for n in names}
+            mtimes = tuple(files[n][0] for n in names)
+            cached = self._templates.get(tool)
+            if cached and cached[0] == mtimes:
+                return cached[1]
+            overview = [files[n][1] for n in prompt_cfg.get("overview", []) if files[n][1]]
+            specs = [files[n][1] for n in prompt_cfg.get("spec", []) if files[n][1]]
+            sections = []
+            if overview:
+                sections.append("\n\n".join(overview))
+            sections.append("\n\n".join(["STRICT OUTPUT RULES:"] + specs + OUTPUT_RULES))
+            sections.append("Below is dynamic content to analyze. Apply the STRICT OUTPUT RULES above.")
+            prefix = "\n\n".join(sections)
+            version = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+            tpl = PromptTemplate(tool=tool, version=version, prefix=prefix)
+            self._templates[tool] = (mtimes, tpl)
+            return tpl
+
+    def versions(self):
+        return {tool: self.template(tool).version for tool in self.tool_prompts}
 
 
 TOOL_PROMPTS = {
@@ -90,33 +327,14 @@ TOOL_PROMPTS = {
     },
 }
 
+PROMPTS = PromptRegistry(PROMPT_DIR, TOOL_PROMPTS)
 
-def build_llm_prompt(tool: str, user_prompt: str):
-    prompt_cfg = TOOL_PROMPTS.get(tool, {})
-    overview_files = prompt_cfg.get("overview", [])
-    spec_files = prompt_cfg.get("spec", [])
-
-    overview = [load_prompt_file(f) for f in overview_files if load_prompt_file(f)]
-    specs = [load_prompt_file(f) for f in spec_files if load_prompt_file(f)]
-
-    strict_rules = "\n\n".join(
-        ["STRICT OUTPUT RULES:"]
-        + specs
-        + [
-            "- Return exactly ONE JSON object.",
-            "- Do NOT wrap output in markdown, code fences, or prose.",
-            "- If uncertain, return required keys with empty arrays/strings.",
-            "- Respect schema constraints and allowed IDs.",
-        ]
-    )
 
-    sections = []
-    if overview:
-        sections.append("\n\n".join(overview))
-    sections.append("Below is dynamic content to analyze. Do not act until after STRICT OUTPUT RULES.")
-    sections.append("USER REQUEST:\n" + user_prompt)
-    sections.append(strict_rules)
-    return "\n\n".join(sections)
+def build_llm_prompt(tool: str, user_prompt: str):
+    # static prefix first so the serving stack's prefix/KV cache can hit; dynamic content last
+    # the version is returned alongside so responses can be keyed to the template that produced them
+    tpl = PROMPTS.template(tool)
+    return tpl.prefix + "\n\nUSER REQUEST:\n" + user_prompt, tpl.version
 
 
 def resolve_local_path(ref: str):
@@ -227,12 +445,16 @@ def _cohort_id_from_ref(ref: str):
     return None
 
 
+MODEL_CMD_TIMEOUT_SECS = float(os.getenv("ACP_MODEL_CMD_TIMEOUT_SECS", "120"))
+
+
 def _run_cli_model(cmd: str, prompt: str, label: str):
     """Run a CLI that accepts prompt via stdin and returns JSON text."""
     try:
         args = shlex.split(cmd)
         log_lines(f"{label} OUTGOING TEXT > ", prompt)
-        p = subprocess.run(args, input=prompt, capture_output=True, check=True, text=True)
+        # bounded so a hung process cannot hold an admission slot forever
+        p = subprocess.run(args, input=prompt, capture_output=True, check=True, text=True, timeout=MODEL_CMD_TIMEOUT_SECS)
         txt = (p.stdout or "").strip()
         if p.stderr:
             log_lines(f"{label} STDERR > ", p.stderr.strip())
@@ -294,14 +516,203 @@ def _chat_openwebui(prompt: str):
     return None
 
 
+class AdmissionRejected(Exception):
+    """Raised when a model call would wait past its admission deadline."""
+
+    def __init__(self, backend: str, reason: str, retry_after: float):
+        super().__init__(f"{backend} backend overloaded: {reason}")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Per-minute token bucket; `per_minute <= 0` disables the limit."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float):
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self.level -= amount
+
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+# clients that don't send X-ACP-Priority (curl, batch scripts) queue behind interactive R calls
+DEFAULT_PRIORITY = os.getenv("ACP_DEFAULT_PRIORITY", "batch")
+if DEFAULT_PRIORITY not in PRIORITIES:
+    raise ValueError(f"ACP_DEFAULT_PRIORITY must be one of {', '.join(PRIORITIES)} (got {DEFAULT_PRIORITY!r})")
+SERVICE_EWMA_ALPHA = 0.2
+
+
+class BackendLimiter:
+    """
+    Admission control for one model backend: a concurrency cap plus request- and
+    token-per-minute buckets, served in priority order (interactive before batch).
+    Callers whose estimated or actual wait exceeds `deadline` are rejected early.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rpm: float, tpm: float, deadline: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.deadline = deadline
+        self.active = 0
+        self._queue = []  # heap of [priority, seq, tokens]
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.avg_service = 0.0  # EWMA of admitted call duration, seconds
+        self.stats = {"admitted": 0, "rejected": 0, "queue_time_total": 0.0, "queue_time_max": 0.0}
+
+    def _bucket_wait(self, n_requests: int, n_tokens: float, now: float):
+        return max(self.requests.wait_time(n_requests, now), self.tokens.wait_time(n_tokens, now))
+
+    def _estimate_wait(self, ahead: list, est_tokens: float, now: float):
+        # callers that cannot start immediately wait roughly one service time per "wave" of slots
+        waiting = max(0, len(ahead) + 1 - (self.max_concurrency - self.active))
+        slot_wait = math.ceil(waiting / self.max_concurrency) * self.avg_service
+        return max(slot_wait, self._bucket_wait(len(ahead) + 1, sum(e[2] for e in ahead) + est_tokens, now))
+
+    def _reject(self, reason: str, retry_after: float):
+        self.stats["rejected"] += 1
+        raise AdmissionRejected(self.name, reason, retry_after)
+
+    def acquire(self, est_tokens: int, priority: str = "interactive"):
+        if self.tokens.capacity > 0:
+            est_tokens = min(est_tokens, self.tokens.capacity)
+        entry = [PRIORITIES.get(priority, 0), next(self._seq), est_tokens]
+        start = time.monotonic()
+        give_up = start + self.deadline
+        with self._cond:
+            ahead = [e for e in self._queue if e < entry]
+            est_wait = self._estimate_wait(ahead, est_tokens, start)
+            if est_wait > self.deadline:
+                self._reject(f"estimated wait {est_wait:.1f}s exceeds {self.deadline:g}s deadline", est_wait)
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] is entry and self.active < self.max_concurrency:
+                        wait = self._bucket_wait(1, est_tokens, now)
+                        if wait == 0:
+                            break
+                        if now + wait > give_up:
+                            self._reject(f"rate limit wait {wait:.1f}s exceeds deadline", wait)
+                    remaining = give_up - now
+                    if remaining <= 0:
+                        ahead = [e for e in self._queue if e < entry]
+                        retry = max(1.0, self._estimate_wait(ahead, est_tokens, now))
+                        self._reject(f"queued longer than {self.deadline:g}s deadline", retry)
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+                self.requests.take(1, now)
+                self.tokens.take(est_tokens, now)
+                self.active += 1
+                queued = now - start
+                self.stats["admitted"] += 1
+                self.stats["queue_time_total"] += queued
+                self.stats["queue_time_max"] = max(self.stats["queue_time_max"], queued)
+            finally:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def release(self, service_time: float = None):
+        with self._cond:
+            self.active -= 1
+            if service_time is not None:
+                if self.avg_service:
+                    self.avg_service += SERVICE_EWMA_ALPHA * (service_time - self.avg_service)
+                else:
+                    self.avg_service = service_time
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, est_tokens: int, priority: str = "interactive"):
+        self.acquire(est_tokens, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self):
+        with self._cond:
+            admitted = self.stats["admitted"]
+            return {
+                "active": self.active,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "admitted": admitted,
+                "rejected": self.stats["rejected"],
+                "queue_time_avg": self.stats["queue_time_total"] / admitted if admitted else 0.0,
+                "queue_time_max": self.stats["queue_time_max"],
+                "service_time_avg": self.avg_service,
+            }
+
+
+def _make_limiter(name: str, env_prefix: str, default_concurrency: int):
+    return BackendLimiter(
+        name,
+        max_concurrency=int(os.getenv(f"{env_prefix}_MAX_CONCURRENCY", str(default_concurrency))),
+        rpm=float(os.getenv(f"{env_prefix}_RPM", "60")),
+        tpm=float(os.getenv(f"{env_prefix}_TPM", "0")),
+        deadline=float(os.getenv("ACP_ADMISSION_DEADLINE_SECS", "30")),
+    )
+
+
+LIMITERS = {
+    "openwebui": _make_limiter("openwebui", "ACP_OPENWEBUI", 4),
+    "cli": _make_limiter("cli", "ACP_MODEL_CMD", 2),
+}
+
+
+def _request_priority():
+    if not has_request_context():
+        return DEFAULT_PRIORITY
+    prio = (request.headers.get("X-ACP-Priority") or DEFAULT_PRIORITY).strip().lower()
+    return prio if prio in PRIORITIES else DEFAULT_PRIORITY
+
+
+def _estimate_tokens(prompt: str):
+    # rough chars-per-token heuristic; only used for rate limiting
+    return max(1, len(prompt) // 4)
+
+
 def maybe_call_model(prompt: str):
+    priority = _request_priority()
+    est_tokens = _estimate_tokens(prompt)
+    cli_cmd = os.getenv("ACP_MODEL_CMD")
     if os.getenv("OPENWEBUI_API_KEY"):
-        res = _chat_openwebui(prompt)
+        try:
+            with LIMITERS["openwebui"].admit(est_tokens, priority):
+                res = _chat_openwebui(prompt)
+        except AdmissionRejected as e:
+            if not cli_cmd:
+                raise
+            print(f"[admission] {e}; falling back to ACP_MODEL_CMD", file=sys.stderr)
+            res = None
         if res is not None:
             return res
-    cli_cmd = os.getenv("ACP_MODEL_CMD")
     if cli_cmd:
-        return _run_cli_model(cli_cmd, prompt, label="ACP MODEL")
+        with LIMITERS["cli"].admit(est_tokens, priority):
+            return _run_cli_model(cli_cmd, prompt, label="ACP MODEL")
     return None
 
 
@@ -370,43 +781,44 @@ def execute_llm_actions():
     if not isinstance(actions, list):
         return jsonify({"error": "actions must be a list"}), 400
 
-    raw = load_json(ref)
-    if not isinstance(raw, (dict, list)):
-        return jsonify({"error": "only concept-set actions are supported in this prototype"}), 400
-
-    total_applied = 0
-    preview_changes = []
-    ignored = []
-    cs = raw
-
-    for act in actions:
-        atype = act.get("type") or act.get("op")
-        if atype == "set_include_descendants":
-            where = act.get("where", {}) if isinstance(act, dict) else {}
-            allowed_keys = {"domainId", "conceptClassId", "includeDescendants"}
-            where = {k: v for k, v in where.items() if k in allowed_keys}
-            value = bool(act.get("value", True))
-            before = len(preview_changes)
-            cs, changed = apply_set_include_descendants(cs, where=where, value=value)
-            preview_changes.extend(changed)
-            if len(preview_changes) > before:
-                total_applied += 1
+    with artifact_lock(ref) if write else nullcontext():
+        raw = load_json(ref)
+        if not isinstance(raw, (dict, list)):
+            return jsonify({"error": "only concept-set actions are supported in this prototype"}), 400
+
+        total_applied = 0
+        preview_changes = []
+        ignored = []
+        cs = raw
+
+        for act in actions:
+            atype = act.get("type") or act.get("op")
+            if atype == "set_include_descendants":
+                where = act.get("where", {}) if isinstance(act, dict) else {}
+                allowed_keys = {"domainId", "conceptClassId", "includeDescendants"}
+                where = {k: v for k, v in where.items() if k in allowed_keys}
+                value = bool(act.get("value", True))
+                before = len(preview_changes)
+                cs, changed = apply_set_include_descendants(cs, where=where, value=value)
+                preview_changes.extend(changed)
+                if len(preview_changes) > before:
+                    total_applied += 1
+                else:
+                    ignored.append({"type": atype, "reason": "no items matched filter"})
             else:
-                ignored.append({"type": atype, "reason": "no items matched filter"})
+                ignored.append({"type": atype, "reason": "unsupported action type"})
+
+        written_to = None
+        applied = False
+        if write:
+            target = ref
+            try:
+                written_to, backup_file = write_json(target, cs, backup=backup, overwrite=overwrite or False)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            applied = True
         else:
-            ignored.append({"type": atype, "reason": "unsupported action type"})
-
-    written_to = None
-    applied = False
-    if write:
-        target = ref
-        try:
-            written_to, backup_file = write_json(target, cs, backup=backup, overwrite=overwrite or False)
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
-        applied = True
-    else:
-        backup_file = None
+            backup_file = None
 
     return jsonify(
         {
@@ -427,6 +839,24 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    resp = jsonify({"error": str(e), "backend": e.backend, "retry_after": round(e.retry_after, 1)})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(1, int(e.retry_after + 0.999)))
+    return resp
+
+
+@app.get("/admission")
+def admission_metrics():
+    return jsonify({name: lim.snapshot() for name, lim in LIMITERS.items()})
+
+
+@app.get("/prompts")
+def prompt_versions():
+    return jsonify({"versions": PROMPTS.versions()})
+
+
 @app.post("/tools/propose_concept_set_diff")
 def propose_concept_set_diff():
     body = request.get_json(force=True)
@@ -491,7 +921,8 @@ def propose_concept_set_diff():
     user_prompt = f"""Tool: concept-sets-review
 Study intent: {study_intent}
 First 20 items: {json.dumps(items[:20])}"""
-    llm = maybe_call_model(build_llm_prompt("concept-sets-review", user_prompt))
+    prompt, prompt_version = build_llm_prompt("concept-sets-review", user_prompt)
+    llm = maybe_call_model(prompt)
     if llm:
         for f in llm.get("findings", []):
             if f not in findings:
@@ -502,7 +933,16 @@ First 20 items: {json.dumps(items[:20])}"""
         if isinstance(llm.get("actions"), list):
             actions = llm["actions"]
 
-    return jsonify({"plan": plan, "findings": findings, "patches": patches, "actions": actions, "risk_notes": risk_notes})
+    return jsonify(
+        {
+            "plan": plan,
+            "findings": findings,
+            "patches": patches,
+            "actions": actions,
+            "risk_notes": risk_notes,
+            "prompt_version": prompt_version,
+        }
+    )
 
 
 @app.post("/tools/cohort_lint")
@@ -531,7 +971,8 @@ def cohort_lint():
 
     prompt_body = f"""Tool: cohort-critique-general-design
 Cohort excerpt: {json.dumps({k: cohort.get(k) for k in list(cohort.keys())[:5]})}"""
-    llm = maybe_call_model(build_llm_prompt("cohort-critique-general-design", prompt_body))
+    prompt, prompt_version = build_llm_prompt("cohort-critique-general-design", prompt_body)
+    llm = maybe_call_model(prompt)
     if llm:
         for f in llm.get("findings", []):
             if f not in findings:
@@ -542,7 +983,16 @@ Cohort excerpt: {json.dumps({k: cohort.get(k) for k in list(cohort.keys())[:5]})
         if isinstance(llm.get("actions"), list):
             actions = llm["actions"]
 
-    return jsonify({"plan": plan, "findings": findings, "patches": patches, "actions": actions, "risk_notes": risk_notes})
+    return jsonify(
+        {
+            "plan": plan,
+            "findings": findings,
+            "patches": patches,
+            "actions": actions,
+            "risk_notes": risk_notes,
+            "prompt_version": prompt_version,
+        }
+    )
 
 
 @app.post("/actions/concept_set_edit")
@@ -555,26 +1005,27 @@ def concept_set_edit():
     output_path = body.get("outputPath")
     overwrite = bool(body.get("overwrite", True))
 
-    cs = load_json(ref)
-    all_preview = []
+    with artifact_lock(output_path or ref) if write else nullcontext():
+        cs = load_json(ref)
+        all_preview = []
 
-    for op in ops:
-        if op.get("op") == "set_include_descendants":
-            where = op.get("where", {})
-            value = op.get("value", True)
-            cs, preview = apply_set_include_descendants(cs, where=where, value=value)
-            all_preview.extend(preview)
+        for op in ops:
+            if op.get("op") == "set_include_descendants":
+                where = op.get("where", {})
+                value = op.get("value", True)
+                cs, preview = apply_set_include_descendants(cs, where=where, value=value)
+                all_preview.extend(preview)
 
-    written_to = None
-    applied = False
-    backup_file = None
-    if write:
-        target = output_path or ref
-        try:
-            written_to, backup_file = write_json(target, cs, backup=backup, overwrite=overwrite)
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
-        applied = True
+        written_to = None
+        applied = False
+        backup_file = None
+        if write:
+            target = output_path or ref
+            try:
+                written_to, backup_file = write_json(target, cs, backup=backup, overwrite=overwrite)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            applied = True
 
     plan = "Set includeDescendants=true for Drug/Ingredient entries that lack it."
     return jsonify(
@@ -611,7 +1062,8 @@ Allowed cohortIds: {[r['cohortId'] for r in catalog_rows]}
 Study intent (truncated): {protocol_text[:2000]}
 Catalog preview (first 200 rows): {json.dumps(catalog_rows[:200])}"""
 
-    llm = maybe_call_model(build_llm_prompt("phenotype_recommendations", user_prompt))
+    prompt, prompt_version = build_llm_prompt("phenotype_recommendations", user_prompt)
+    llm = maybe_call_model(prompt)
     mode = "llm"
     if llm and isinstance(llm.get("phenotype_recommendations"), list):
         recs = _filter_catalog_recs(llm.get("phenotype_recommendations"), catalog_rows, max_results)
@@ -634,6 +1086,7 @@ Catalog preview (first 200 rows): {json.dumps(catalog_rows[:200])}"""
             "plan": plan,
             "phenotype_recommendations": recs,
             "mode": mode,
+            "prompt_version": prompt_version,
             "artifact": {"protocolRef": protocol_ref, "cohortsCatalogRef": catalog_ref},
         }
     )
@@ -673,7 +1126,8 @@ Study intent (truncated): {protocol_text[:2000]}
 Phenotype names: {json.dumps([{'ref': c['ref'], 'name': c['cohort'].get('name') or c['cohort'].get('Name')} for c in cohorts])}
 Characterization summaries (optional paths): {characterization_refs}"""
 
-    llm = maybe_call_model(build_llm_prompt("phenotype_improvements", user_prompt))
+    prompt, prompt_version = build_llm_prompt("phenotype_improvements", user_prompt)
+    llm = maybe_call_model(prompt)
     mode = "llm"
     improvements = []
     code_suggestion = None
@@ -696,6 +1150,7 @@ Characterization summaries (optional paths): {characterization_refs}"""
             "phenotype_improvements": improvements,
             "code_suggestion": code_suggestion,
             "mode": mode,
+            "prompt_version": prompt_version,
             "artifact": {"protocolRef": protocol_ref, "cohortRefs": cohort_refs, "characterizationRefs": characterization_refs},
         }
     )